@@ -101,10 +101,10 @@ if uploaded_spectrum_file:
         df = pd.read_csv(uploaded_spectrum_file, sep="\t")
     elif uploaded_spectrum_file.name.endswith(".xlsx"):
         with xls_sheet_name.container():
-            xls = pd.ExcelFile(uploaded_spectrum_file)
-            sheet_name = st.selectbox("Select a sheet", xls.sheet_names)
+            sheet_names = analysis.read_xlsx_sheet_names(uploaded_spectrum_file)
+            sheet_name = st.selectbox("Select a sheet", sheet_names)
             if sheet_name:
-                df = pd.read_excel(xls, sheet_name=sheet_name)[1:]
+                df = analysis.read_xlsx_spectrum(uploaded_spectrum_file, sheet_name)
             else:
                 st.stop()
     else:
@@ -140,31 +140,34 @@ if submit_button and not uploaded_spectrum_file:
     st.error("No file uploaded!")
     st.stop()
 
-if submit_button:
+
+@st.fragment
+def render_results(df: pd.DataFrame, df_mono: pd.DataFrame, params: dict):
+    """
+    Analyse the spectrum and render the results in their own fragment.
+    """
     # Analyse spectrum
-    df_mono = (
-        mono.make_df_mono()
-        if not uploaded_mono_file
-        else mono.make_df_mono(uploaded_mono_file)
-    )
     df = analysis.preprocess_data(
-        df, threshold=threshold, m_z_range=m_z_range, isotope_tol=isotope_tol
+        df,
+        threshold=params["threshold"],
+        m_z_range=params["m_z_range"],
+        isotope_tol=params["isotope_tol"],
     )
     df_diffs, df_diffs_assigned, df_diffs_unassigned, df_unmatched = (
         analysis.analyse_spectrum(
             df,
             df_mono,
-            mass_tol=mass_tol,
-            length=length,
-            use_mods=use_mods,
-            use_b_y=use_b_y,
+            mass_tol=params["mass_tol"],
+            length=params["length"],
+            use_mods=params["use_mods"],
+            use_b_y=params["use_b_y"],
         )
     )
     if df_diffs is None:
         st.error(
             "No peaks found. Check the spectrum file / widen the m/z range / reduce the threshold and try again."
         )
-        st.stop()
+        return
 
     # Show results
     top, bottom = st.container(), st.container()
@@ -211,5 +214,26 @@ if submit_button:
                 use_container_width=True,
             )
 
+
+if submit_button:
+    df_mono = (
+        mono.make_df_mono()
+        if not uploaded_mono_file
+        else mono.make_df_mono(uploaded_mono_file)
+    )
+    render_results(
+        df,
+        df_mono,
+        dict(
+            threshold=threshold,
+            m_z_range=m_z_range,
+            isotope_tol=isotope_tol,
+            mass_tol=mass_tol,
+            length=length,
+            use_mods=use_mods,
+            use_b_y=use_b_y,
+        ),
+    )
+
 else:
-    st.info("Upload a spectrum file and click Analyse to begin.")
\ No newline at end of file
+    st.info("Upload a spectrum file and click Analyse to begin.")
@@ -0,0 +1,67 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def match_pairs(mz, mono_mz, order, mass_tol):
+    """
+    Compute all pairwise peak differences and the first reference row (in table
+    order) within tolerance of each, or len(order) if there is none.
+    """
+    n = len(mz)
+    m = len(mono_mz)
+    size = n * (n - 1) // 2
+    peak1 = np.empty(size)
+    peak2 = np.empty(size)
+    diffs = np.empty(size)
+    match = np.full(size, m)
+    for i in range(n):
+        # Row i of the upper triangle starts after the (n - 1 - r) pairs of each r < i.
+        start = i * (n - 1) - i * (i - 1) // 2
+        for j in range(i + 1, n):
+            p = start + j - i - 1
+            d = abs(mz[i] - mz[j])
+            peak1[p] = mz[i]
+            peak2[p] = mz[j]
+            diffs[p] = d
+            k = max(np.searchsorted(mono_mz, d - mass_tol) - 1, 0)
+            while k < m and mono_mz[k] - d < mass_tol:
+                if abs(mono_mz[k] - d) < mass_tol and order[k] < match[p]:
+                    match[p] = order[k]
+                k += 1
+    return peak1, peak2, diffs, match
+
+
+@njit(cache=True)
+def build_edge_arrays(P, src, dst, is_bb):
+    """
+    Split edges into backbone / other NaN-separated line segments in one pass,
+    returning (xs_bb, ys_bb, xs_other, ys_other).
+    """
+    n_bb = 0
+    for e in range(len(src)):
+        if is_bb[e]:
+            n_bb += 1
+    n_other = len(src) - n_bb
+    xs_bb = np.full(3 * n_bb, np.nan)
+    ys_bb = np.full(3 * n_bb, np.nan)
+    xs_other = np.full(3 * n_other, np.nan)
+    ys_other = np.full(3 * n_other, np.nan)
+    b = 0
+    o = 0
+    for e in range(len(src)):
+        u = src[e]
+        v = dst[e]
+        if is_bb[e]:
+            xs_bb[b] = P[u, 0]
+            ys_bb[b] = P[u, 1]
+            xs_bb[b + 1] = P[v, 0]
+            ys_bb[b + 1] = P[v, 1]
+            b += 3
+        else:
+            xs_other[o] = P[u, 0]
+            ys_other[o] = P[u, 1]
+            xs_other[o + 1] = P[v, 0]
+            ys_other[o + 1] = P[v, 1]
+            o += 3
+    return xs_bb, ys_bb, xs_other, ys_other
@@ -1,93 +1,148 @@
+import io
+import numpy as np
+import openpyxl
 import pandas as pd
-from itertools import combinations
+import streamlit as st
+from array import array
+from numbers import Real
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 from typing import Tuple, List
 import itertools
-from . import mono
+from . import _kernels, mono
 
 
-def prune_isotopes(df: pd.DataFrame, isotope_tol: float = 1.0) -> pd.DataFrame:
+@st.cache_resource(show_spinner=False, max_entries=8)
+def open_xlsx(file_bytes: bytes) -> openpyxl.Workbook:
+    """
+    Open a spectrum workbook once and share it across reruns and sheet selections.
+    """
+    return openpyxl.load_workbook(
+        io.BytesIO(file_bytes), read_only=True, data_only=True
+    )
+
+
+@st.cache_data(show_spinner=False, hash_funcs={UploadedFile: lambda f: f.getvalue()})
+def read_xlsx_sheet_names(uploaded_file: UploadedFile) -> List[str]:
+    """
+    List the worksheets of an uploaded spectrum workbook.
+    """
+    return open_xlsx(uploaded_file.getvalue()).sheetnames
+
+
+@st.cache_data(show_spinner=False, hash_funcs={UploadedFile: lambda f: f.getvalue()})
+def read_xlsx_spectrum(uploaded_file: UploadedFile, sheet_name: str) -> pd.DataFrame:
+    """
+    Stream the m/z and intensity columns of a worksheet, skipping the two header rows.
+    """
+    ws = open_xlsx(uploaded_file.getvalue())[sheet_name]
+    mz, intensity = array("d"), array("d")
+    for x, y in ws.iter_rows(min_row=3, max_col=2, values_only=True):
+        if isinstance(x, Real) and isinstance(y, Real):
+            mz.append(x)
+            intensity.append(y)
+    return pd.DataFrame(
+        {"m/z": np.frombuffer(mz), "Intensity": np.frombuffer(intensity)}
+    )
+
+
+def prune_isotopes(
+    mz: np.ndarray, intensity: np.ndarray, isotope_tol: float = 1.0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     If isotopes within prescribed tolerance exist, retain only that with the smallest m/z.
+    Returns the sorted m/z, intensity and inferred charge state of the retained peaks.
     """
-    charge_states = range(1, 6)
+    charge_states = np.arange(1, 6)
     tol = 1e-3
-    df = df.sort_values("m/z").reset_index(drop=True)
-    to_drop = []
-    for i in range(len(df) - 1):
+    order = np.argsort(mz)
+    mz, intensity = mz[order], intensity[order]
+
+    # A peak is an isotope if it lies within tolerance of the peak before it.
+    keep = np.ones(len(mz), dtype=bool)
+    keep[1:] = np.diff(mz) >= isotope_tol
+
+    charge = np.full(len(mz), np.nan)
+    for i in np.flatnonzero(keep[:-1]):
         j = i + 1
-        diffs = []
-        while j < len(df) and abs(df.loc[i, "m/z"] - df.loc[j, "m/z"]) < isotope_tol:
-            diffs.append(abs(df.loc[i, "m/z"] - df.loc[j, "m/z"]))
-            to_drop.append(j)
+        while j < len(mz) and mz[j] - mz[i] < isotope_tol:
             j += 1
-        matches = [
-            z
-            for z in charge_states
-            if all(abs((1 / z) - diff) <= tol for diff in diffs)
+        diffs = mz[i + 1 : j] - mz[i]
+        matches = charge_states[
+            np.all(np.abs(1 / charge_states[:, None] - diffs) <= tol, axis=1)
         ]
-        df.loc[i, "Charge State"] = 1 if not matches else matches[0]
+        charge[i] = 1 if not len(matches) else matches[0]
 
-    return df.drop(to_drop).reset_index(drop=True)
+    return mz[keep], intensity[keep], charge[keep]
 
 
 def threshold_peaks(
-    df: pd.DataFrame, threshold: float = 0.10, m_z_range: Tuple[int, int] = (0, 5000)
-) -> pd.DataFrame:
+    mz: np.ndarray,
+    intensity: np.ndarray,
+    threshold: float = 0.10,
+    m_z_range: Tuple[int, int] = (0, 5000),
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     Discard peaks with intensity below a specified % of the tallest peak.
     """
-    max_intensity = df["Intensity"].max()
-    df = df[df["Intensity"] > threshold * 0.01 * max_intensity].reset_index()
-    df = df[(df["m/z"] >= m_z_range[0]) & (df["m/z"] <= m_z_range[1])]
-    return df
+    max_intensity = np.nanmax(intensity, initial=-np.inf)
+    keep = (
+        (intensity > threshold * 0.01 * max_intensity)
+        & (mz >= m_z_range[0])
+        & (mz <= m_z_range[1])
+    )
+    return mz[keep], intensity[keep]
 
 
+@st.cache_data(show_spinner=False)
 def preprocess_data(
     df: pd.DataFrame, threshold: float, m_z_range: Tuple[int, int], isotope_tol=1.0
 ) -> pd.DataFrame:
     """
     Threshold and prune isotopes of input spectrum.
     """
-    df = threshold_peaks(df, threshold=threshold, m_z_range=m_z_range)
-    df = prune_isotopes(df, isotope_tol=isotope_tol)
-    return df
+    mz = df["m/z"].to_numpy(dtype=np.float64)
+    intensity = df["Intensity"].to_numpy(dtype=np.float64)
+    mz, intensity = threshold_peaks(
+        mz, intensity, threshold=threshold, m_z_range=m_z_range
+    )
+    mz, intensity, charge = prune_isotopes(mz, intensity, isotope_tol=isotope_tol)
+    return pd.DataFrame({"m/z": mz, "Intensity": intensity, "Charge State": charge})
 
 
+@st.cache_data(show_spinner=False)
 def generate_polysaccharides(
-    df_mono: pd.DataFrame, monosaccharide_list: List[str], length: int = 1
+    df_mono: pd.DataFrame, monosaccharide_list: Tuple[str, ...], length: int = 1
 ) -> pd.DataFrame:
     """
     Generate n-length combinations of monosaccharides in the list provided.
     """
-    df_mono.set_index("Name", inplace=True)
-    data = []
+    mz_by_name = dict(zip(df_mono["Name"], df_mono["m/z"]))
+    symbol_by_name = dict(zip(df_mono["Name"], df_mono["Symbol"]))
+    ion_by_name = dict(zip(df_mono["Name"], df_mono["Ion Type"]))
     polysaccharides = []
     for r in range(2, length + 1):
         polysaccharides.extend(
             itertools.combinations_with_replacement(monosaccharide_list, r)
         )
+    names, symbols, masses, ion_types, lengths = [], [], [], [], []
     for poly_sacc in polysaccharides:
-        item = {
-            "Name": "",
-            "Symbol": "",
-            "m/z": 0,
+        names.append(" + ".join(poly_sacc))
+        symbols.append(" + ".join(symbol_by_name[m] for m in poly_sacc))
+        masses.append(sum(mz_by_name[m] for m in poly_sacc))
+        ion_types.append("".join(ion_by_name[m] for m in poly_sacc))
+        lengths.append(len(poly_sacc))
+
+    return pd.DataFrame(
+        {
+            "Name": names,
+            "Symbol": symbols,
+            "m/z": np.asarray(masses, dtype=np.float64),
             "Symbol Description": "Polysaccharide",
-            "Ion Type": "",
+            "Ion Type": ion_types,
+            "length": lengths,
+            "Type": "Polysaccharide",
         }
-        for mono_sacc in poly_sacc:
-            df_mono_sacc = df_mono.loc[mono_sacc]
-            item["Name"] += df_mono_sacc.name + " + "
-            item["Symbol"] += df_mono_sacc["Symbol"] + " + "
-            item["m/z"] += df_mono_sacc["m/z"]
-            item["Ion Type"] += df_mono_sacc["Ion Type"]
-        
-        item["Name"] = item["Name"][:-3]
-        item["Symbol"] = item["Symbol"][:-3]
-        item["length"] = len(poly_sacc)
-        item["Type"] = "Polysaccharide"
-        data.append(item)
-    
-    return pd.DataFrame(data)
+    )
 
 
 def assign_polysaccharides(
@@ -99,39 +154,118 @@ def assign_polysaccharides(
     """
     Assign peak differences for polysaccharides of length >= 2.
     """
+    assigned_mask = df_diffs["Assigned Mass"].to_numpy() != 0
     if length > 1:
-        monosaccharide_list = df_diffs[df_diffs["Assigned Mass"] != 0][
-            "Assigned"
-        ].unique()
+        monosaccharide_list = tuple(df_diffs["Assigned"].iloc[assigned_mask].unique())
         df_poly = generate_polysaccharides(df_mono, monosaccharide_list, length)
-        for idx, row in df_diffs.iterrows():
-            if row["Assigned Mass"] != 0:
-                continue
-            diff = row["Peak Difference"]
-            if diff >= df_poly["m/z"].min():
-                poly_sacc = df_poly[abs(df_poly["m/z"] - diff) < mass_tol]
-                if not poly_sacc.empty:
-                    assigned_names = ", ".join(poly_sacc["Name"].astype(str))
-                    assigned_symbols = ", ".join(poly_sacc["Symbol"].astype(str))
-                    assigned_mass = poly_sacc["m/z"].iloc[-1]
-                    assigned_ion = poly_sacc["Ion Type"].iloc[-1]
-                    assigned_len = poly_sacc["length"].iloc[-1]
-                    assigned_type = poly_sacc["Type"].iloc[-1]
-
-                    df_diffs.loc[idx, "Assigned"] = assigned_names
-                    df_diffs.loc[idx, "Assigned Symbol"] = assigned_symbols
-                    df_diffs.loc[idx, "Assigned Mass"] = assigned_mass
-                    df_diffs.loc[idx, "Ion Type"] = assigned_ion
-                    df_diffs.loc[idx, "Length"] = assigned_len
-                    df_diffs.loc[idx, "Type"] = assigned_type
-
-    df_diffs_assigned = df_diffs[df_diffs["Assigned Mass"] != 0].reset_index(drop=True)
-    df_diffs_unassigned = df_diffs[df_diffs["Assigned Mass"] == 0].reset_index(
-        drop=True
-    )
+        if not df_poly.empty:
+            poly_mz = df_poly["m/z"].to_numpy(dtype=np.float64)
+            order = np.argsort(poly_mz, kind="stable")
+            poly_sorted = poly_mz[order]
+            poly_min = poly_sorted[0]
+            diffs = df_diffs["Peak Difference"].to_numpy()
+            pending = np.flatnonzero(~assigned_mask & (diffs >= poly_min))
+            d = diffs[pending]
+
+            # Slightly widened windows of candidates, narrowed until both ends pass
+            # the same abs(m/z - diff) < mass_tol test as the monosaccharide match.
+            slack = 1e-6 * max(mass_tol, 1.0)
+            lo = np.searchsorted(poly_sorted, d - mass_tol - slack, "left")
+            hi = np.searchsorted(poly_sorted, d + mass_tol + slack, "right")
+            top = len(poly_sorted) - 1
+            while True:
+                step = (lo < hi) & ~(
+                    np.abs(poly_sorted[np.minimum(lo, top)] - d) < mass_tol
+                )
+                if not step.any():
+                    break
+                lo[step] += 1
+            while True:
+                step = (lo < hi) & ~(np.abs(poly_sorted[hi - 1] - d) < mass_tol)
+                if not step.any():
+                    break
+                hi[step] -= 1
+            found = hi > lo
+
+            # Differences sharing the same window of candidates share an assignment.
+            windows, inverse = np.unique(
+                np.stack([lo[found], hi[found]], axis=1), axis=0, return_inverse=True
+            )
+            names = df_poly["Name"].astype(str).to_numpy()
+            symbols = df_poly["Symbol"].astype(str).to_numpy()
+            assigned = {
+                "Assigned": [],
+                "Assigned Symbol": [],
+                "Assigned Mass": [],
+                "Ion Type": [],
+                "Length": [],
+                "Type": [],
+            }
+            for start, stop in windows:
+                rows = np.sort(order[start:stop])
+                last = rows[-1]
+                assigned["Assigned"].append(", ".join(names[rows]))
+                assigned["Assigned Symbol"].append(", ".join(symbols[rows]))
+                assigned["Assigned Mass"].append(poly_mz[last])
+                assigned["Ion Type"].append(df_poly["Ion Type"].iat[last])
+                assigned["Length"].append(df_poly["length"].iat[last])
+                assigned["Type"].append(df_poly["Type"].iat[last])
+
+            targets = pending[found]
+            for col, values in assigned.items():
+                df_diffs.iloc[targets, df_diffs.columns.get_loc(col)] = np.asarray(
+                    values
+                )[inverse.ravel()]
+            assigned_mask[targets] = True
+
+    df_diffs_assigned = df_diffs.iloc[assigned_mask].reset_index(drop=True)
+    df_diffs_unassigned = df_diffs.iloc[~assigned_mask].reset_index(drop=True)
     return df_diffs_assigned, df_diffs_unassigned
 
 
+def compute_peak_differences(
+    df: pd.DataFrame, df_mono: pd.DataFrame, mass_tol: float
+) -> pd.DataFrame:
+    """
+    Compute all pairwise peak differences and match each against the reference.
+    """
+    mz = df["m/z"].to_numpy(dtype=np.float64)
+    ref_mz = df_mono["m/z"].to_numpy(dtype=np.float64)
+    order = np.argsort(ref_mz, kind="stable")
+    mono_mz = ref_mz[order]
+    peak1, peak2, diffs, match = _kernels.match_pairs(mz, mono_mz, order, mass_tol)
+
+    mono_min = mono_mz[0] if len(mono_mz) else np.inf
+    too_small = diffs < mono_min
+    matched = (match < len(order)) & ~too_small
+    rows = match[matched]
+
+    assigned_mass = np.zeros(len(diffs))
+    assigned_mass[matched] = ref_mz[rows]
+    assigned = np.where(too_small, "Too small", "No match").astype(object)
+    assigned[matched] = df_mono["Name"].to_numpy()[rows]
+    columns = {}
+    for col in ["Symbol", "Ion Type", "Type"]:
+        values = np.full(len(diffs), "", dtype=object)
+        values[matched] = df_mono[col].to_numpy()[rows]
+        columns[col] = values
+
+    return pd.DataFrame(
+        {
+            "Peak 1": peak1,
+            "Peak 2": peak2,
+            "Peak Difference": diffs,
+            "Assigned Mass": assigned_mass,
+            "Assigned": assigned,
+            "Assigned Symbol": columns["Symbol"],
+            "Ion Type": columns["Ion Type"],
+            "Type": columns["Type"],
+            "Length": 1,
+        }
+    )
+
+
+@st.cache_data(show_spinner=False)
 def analyse_spectrum(
     df: pd.DataFrame,
     df_mono: pd.DataFrame,
@@ -143,44 +277,10 @@ def analyse_spectrum(
     """
     Compute peak differences for input spectrum and assign wherever possible.
     """
-    data = []
-
     df_mono = df_mono if not use_b_y else mono.make_b_y_df_mono(df_mono)
     df_mono = df_mono if not use_mods else pd.concat([df_mono, mono.MODS])
 
-    for a, b in combinations(df["m/z"], 2):
-        diff = abs(a - b)
-        diff_dict = {
-            "Peak 1": a,
-            "Peak 2": b,
-            "Peak Difference": diff,
-        }
-        if diff >= df_mono["m/z"].min():
-            mono_sacc = df_mono[abs(df_mono["m/z"] - diff) < mass_tol]
-            if not mono_sacc.empty:
-                row = mono_sacc.iloc[0]
-                assigned = (
-                    row["Name"],
-                    row["Symbol"],
-                    row["m/z"],
-                    row["Ion Type"],
-                    row["Type"],
-                )
-            else:
-                assigned = ("No match", "", 0, "", "")
-        else:
-            assigned = ("Too small", "", 0, "", "")
-        diff_dict |= {
-            "Assigned Mass": assigned[2],
-            "Assigned": assigned[0],
-            "Assigned Symbol": assigned[1],
-            "Ion Type": assigned[3],
-            "Type": assigned[4],
-            "Length": 1,
-        }
-        data.append(diff_dict)
-
-    df_diffs = pd.DataFrame(data)
+    df_diffs = compute_peak_differences(df, df_mono, mass_tol)
 
     if not df_diffs.empty:
         df_diffs = df_diffs.sort_values("Assigned Mass", ascending=False)
@@ -198,32 +298,32 @@ def analyse_spectrum(
                 "Assigned Symbol",
             ]
         )
-        df_unmatched = df[
-            ~df["m/z"].isin(df_diffs_assigned["Peak 1"])
-            & ~df["m/z"].isin(df_diffs_assigned["Peak 2"])
-        ].reset_index(drop=True)
-        df_unmatched = df_unmatched.drop(columns=["index"])
+        assigned_peaks = np.union1d(
+            df_diffs_assigned["Peak 1"].to_numpy(),
+            df_diffs_assigned["Peak 2"].to_numpy(),
+        )
+        df_unmatched = df[~df["m/z"].isin(assigned_peaks)].reset_index(drop=True)
     else:
         return None, None, None, None
 
     return df_diffs, df_diffs_assigned, df_diffs_unassigned, df_unmatched
 
 
-def all_combinations(weights, target, idx=0, current=None):
+def all_combinations(weights, target):
     """
     Find all combinations of weights that exactly add up to a target.
     """
-    if current is None:
-        current = []
-
-    if target == 0:
-        yield current
-        return
-    if idx >= len(weights):
-        return
-
-    max_count = target // weights[idx]
-    for k in range(max_count + 1):
-        yield from all_combinations(
-            weights, target - k * weights[idx], idx + 1, current + [k]
-        )
\ No newline at end of file
+    # Explicit stack of (index of next weight, remaining target, counts so far).
+    # Counts are pushed in reverse so combinations come out in lexicographic order.
+    n = len(weights)
+    stack = [(0, target, [])]
+    while stack:
+        idx, remaining, current = stack.pop()
+        if remaining == 0:
+            yield current + [0] * (n - idx)
+        elif idx == n - 1:
+            if remaining % weights[idx] == 0:
+                yield current + [remaining // weights[idx]]
+        elif idx < n:
+            for k in range(remaining // weights[idx], -1, -1):
+                stack.append((idx + 1, remaining - k * weights[idx], current + [k]))
@@ -1,4 +1,7 @@
+import numpy as np
 import pandas as pd
+import streamlit as st
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 
 H20_MASS = 18.010565
 
@@ -10,7 +13,7 @@ MODS = pd.DataFrame(
             "Symbol Description": "Modification",
             "Symbol": "Ac",
             "Ion Type": "",
-            "type": "Modification",
+            "Type": "Modification",
         },
         {
             "Name": "Methylation",
@@ -18,7 +21,7 @@ MODS = pd.DataFrame(
             "Symbol Description": "Modification",
             "Symbol": "Me",
             "Ion Type": "",
-            "type": "Modification",
+            "Type": "Modification",
         },
         {
             "Name": "Phosphorylation",
@@ -26,7 +29,7 @@ MODS = pd.DataFrame(
             "Symbol Description": "Modification",
             "Symbol": "Ph",
             "Ion Type": "",
-            "type": "Modification",
+            "Type": "Modification",
         },
         {
             "Name": "Sulfonation",
@@ -34,12 +37,13 @@ MODS = pd.DataFrame(
             "Symbol Description": "Modification",
             "Symbol": "Su",
             "Ion Type": "",
-            "type": "Modification",
+            "Type": "Modification",
         },
     ]
 )
 
 
+@st.cache_data(show_spinner=False, hash_funcs={UploadedFile: lambda f: f.getvalue()})
 def make_df_mono(uploaded_file: str = "mono.json") -> pd.DataFrame:
     """
     Read monosaccharide reference file.
@@ -51,22 +55,24 @@ def make_df_mono(uploaded_file: str = "mono.json") -> pd.DataFrame:
     return df_mono
 
 
+@st.cache_data(show_spinner=False)
 def make_b_y_df_mono(df_mono: pd.DataFrame) -> pd.DataFrame:
     """
     Split up monosaccharide reference into B and Y ions.
     """
-    df_mono_b = df_mono.copy()
-    df_mono_y = df_mono.copy()
-    df_mono_y["m/z"] = (df_mono_y["m/z"] + H20_MASS).round(2)
+    n = len(df_mono)
+    mz = df_mono["m/z"].to_numpy()
+    names = df_mono["Name"].to_numpy(dtype=str)
+    symbols = df_mono["Symbol"].to_numpy(dtype=str)
 
-    df_mono_y["Symbol"] += " ʸ"
-    df_mono_y["Name"] += " (Y)"
-    df_mono_y["Ion Type"] = "Y"
+    df_b_y = pd.DataFrame({col: np.tile(df_mono[col].to_numpy(), 2) for col in df_mono})
+    df_b_y["m/z"] = np.concatenate([mz, (mz + H20_MASS).round(2)])
+    df_b_y["Symbol"] = np.concatenate(
+        [np.char.add(symbols, " ᵇ"), np.char.add(symbols, " ʸ")]
+    )
+    df_b_y["Name"] = np.concatenate(
+        [np.char.add(names, " (B)"), np.char.add(names, " (Y)")]
+    )
+    df_b_y["Ion Type"] = np.repeat(["B", "Y"], n)
 
-    df_mono_b["Symbol"] += " ᵇ"
-    df_mono_b["Name"] += " (B)"
-    df_mono_b["Ion Type"] = "B"
-
-    df_mono = pd.concat([df_mono_b, df_mono_y], ignore_index=True)
-
-    return df_mono
\ No newline at end of file
+    return df_b_y
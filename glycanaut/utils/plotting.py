@@ -1,32 +1,82 @@
+import numpy as np
 import pandas as pd
 import networkx as nx
 
 import plotly.graph_objects as go
 from plotly.graph_objs import Figure
 
-from typing import Tuple, List
+from typing import Dict, Tuple, List
+
+from . import _kernels
+
+# (color, opacity) of non-backbone and backbone edges in the peak difference graph.
+EDGE_STYLES = (("grey", 0.2), ("#669673", 0.8))
+
+# Layout of the peak difference graph when there is nothing to draw.
+_EMPTY_LAYOUT = dict(
+    showlegend=False,
+    xaxis=dict(visible=False),
+    yaxis=dict(visible=False),
+    margin=dict(l=20, r=20, t=20, b=20),
+)
+
+
+def _segments(points: np.ndarray, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Interleave edge endpoints into x / y arrays of NaN-separated line segments.
+    """
+    xy = np.full((3 * len(edges), 2), np.nan)
+    xy[0::3] = points[edges[:, 0]]
+    xy[1::3] = points[edges[:, 1]]
+    return xy[:, 0], xy[:, 1]
+
+
+def _backbone(G: nx.Graph) -> List:
+    """
+    Shortest path from the largest to the smallest peak, cached on the graph.
+    The cache assumes the graph is not modified after the first call.
+    """
+    if "_backbone" not in G.graph:
+        if "_lo" not in G.graph:
+            G.graph["_lo"], G.graph["_hi"] = min(G.nodes), max(G.nodes)
+        G.graph["_backbone"] = nx.shortest_path(
+            G, source=G.graph["_hi"], target=G.graph["_lo"]
+        )
+    return G.graph["_backbone"]
 
 
 def plot_mass_spectrum(df: pd.DataFrame) -> Figure:
     """
     Plot a mass spectrum from a DataFrame containing "m/z" and "Intensity" columns.
     """
-    fig = go.Figure()
-    if df.empty:
-        return fig
-
-    for x, y in zip(df["m/z"], df["Intensity"]):
-        fig.add_trace(
-            go.Scatter(
-                x=[x, x],
-                y=[0, y],
+    if len(df) == 0:
+        return go.Figure()
+
+    # Draw each peak as a segment (x, 0) -> (x, y) of one trace, separated by gaps.
+    mz = df["m/z"].to_numpy()
+    intensity = df["Intensity"].to_numpy()
+    x = np.full(3 * len(mz), np.nan)
+    x[0::3] = x[1::3] = mz
+    y = np.full(3 * len(mz), np.nan)
+    y[0::3] = 0
+    y[1::3] = intensity
+    text = np.full(len(x), None, dtype=object)
+    text[1::3] = np.char.mod("%.2f", mz)
+    fig = go.Figure(
+        data=[
+            dict(
+                type="scattergl",
+                x=x,
+                y=y,
                 mode="lines+text",
                 line=dict(color="grey", width=2),
-                text=[None, f"{x:.2f}"],
+                text=text,
                 textposition="top center",
                 showlegend=False,
+                hoverinfo="skip",
             )
-        )
+        ]
+    )
 
     fig.update_layout(
         xaxis_title="m/z",
@@ -36,8 +86,6 @@ def plot_mass_spectrum(df: pd.DataFrame) -> Figure:
         margin=dict(l=40, r=40, t=20, b=40),
     )
 
-    fig.update_traces(hoverinfo="skip")
-
     return fig
 
 
@@ -47,52 +95,43 @@ def plot_peak_diff_histogram(
     """
     Plot histogram of peak differences and annotate wherever assigned.
     """
-    df_diffs["Peak Difference (rounded)"] = df_diffs["Peak Difference"].round(1)
     counts = (
-        df_diffs["Peak Difference (rounded)"].value_counts().sort_index().reset_index()
-    )
-    counts.columns = ["Peak Difference", "Count"]
-
-    assigned_info = (
-        df_diffs.groupby("Peak Difference (rounded)")
-        .agg(Assigned=("Assigned Symbol", "first"))
+        df_diffs.assign(**{"Peak Difference": df_diffs["Peak Difference"].round(1)})
+        .groupby("Peak Difference")
+        .agg(Count=("Assigned Symbol", "size"), Assigned=("Assigned Symbol", "first"))
         .reset_index()
     )
-    assigned_info["Peak Difference"] = assigned_info["Peak Difference (rounded)"]
-    counts = counts.merge(assigned_info, on="Peak Difference", how="left")
-
-    assigned = counts[
-        counts["Peak Difference"].isin(df_diffs_assigned["Peak Difference"].round(1))
-    ]
-    unassigned = counts[
-        ~counts["Peak Difference"].isin(df_diffs_assigned["Peak Difference"].round(1))
-    ]
-
-    fig = go.Figure()
-
-    fig.add_trace(
-        go.Bar(
-            x=assigned["Peak Difference"],
-            y=assigned["Count"],
-            name="Assigned",
-            marker_color="#669673",
-            text=assigned["Assigned"],
-            hovertemplate="Peak Difference: %{x}<br>"
-            + "Count: %{y}<br>"
-            + "Assigned: %{text}<extra></extra>",
-        )
+    assigned_rounded = np.unique(
+        df_diffs_assigned["Peak Difference"].round(1).to_numpy()
     )
-
-    fig.add_trace(
-        go.Bar(
-            x=unassigned["Peak Difference"],
-            y=unassigned["Count"],
-            name="Not assigned",
-            marker_color="#d3e3d7",
-            hovertemplate="Peak Difference: %{x}<br>"
-            + "Count: %{y}<br>"
-            + "Assigned: None<extra></extra>",
-        )
+    is_assigned = np.isin(counts["Peak Difference"].to_numpy(), assigned_rounded)
+    assigned = counts[is_assigned]
+    unassigned = counts[~is_assigned]
+
+    fig = go.Figure(
+        data=[
+            dict(
+                type="bar",
+                x=assigned["Peak Difference"],
+                y=assigned["Count"],
+                name="Assigned",
+                marker_color="#669673",
+                text=assigned["Assigned"],
+                hovertemplate="Peak Difference: %{x}<br>"
+                + "Count: %{y}<br>"
+                + "Assigned: %{text}<extra></extra>",
+            ),
+            dict(
+                type="bar",
+                x=unassigned["Peak Difference"],
+                y=unassigned["Count"],
+                name="Not assigned",
+                marker_color="#d3e3d7",
+                hovertemplate="Peak Difference: %{x}<br>"
+                + "Count: %{y}<br>"
+                + "Assigned: None<extra></extra>",
+            ),
+        ]
     )
 
     fig.update_layout(
@@ -110,15 +149,8 @@ def plot_peak_diff_graph(df_assigned: pd.DataFrame) -> Figure:
     Plot a network graph of assigned peak differences.
     """
 
-    if df_assigned.empty:
-        fig = go.Figure()
-        fig.update_layout(
-            showlegend=False,
-            xaxis_visible=False,
-            yaxis_visible=False,
-            margin=dict(l=20, r=20, t=20, b=20),
-        )
-        return fig
+    if len(df_assigned) == 0:
+        return go.Figure(dict(data=[], layout=_EMPTY_LAYOUT))
 
     G = nx.from_pandas_edgelist(
         df_assigned[df_assigned["Type"] != "Modification"],
@@ -126,50 +158,65 @@ def plot_peak_diff_graph(df_assigned: pd.DataFrame) -> Figure:
         "Peak 2",
         edge_attr=["Peak Difference", "Assigned Symbol"],
     )
-    pos = nx.spring_layout(G)
+    if G.number_of_nodes() == 0:
+        return go.Figure(dict(data=[], layout=_EMPTY_LAYOUT))
+    pos = nx.spring_layout(G, seed=0, iterations=20, threshold=1e-2)
 
-    smallest_peak = min(G.nodes)
-    largest_peak = max(G.nodes)
     try:
-        backbone = nx.shortest_path(G, source=largest_peak, target=smallest_peak)
-        backbone_edges = list(zip(backbone[:-1], backbone[1:]))
+        backbone = _backbone(G)
+        backbone_edges = frozenset(zip(backbone[:-1], backbone[1:]))
+        backbone_edges |= frozenset((v, u) for u, v in backbone_edges)
     except:
-        backbone_edges = []
-
-    edge_x, edge_y, edge_colors, opacities = [], [], [], []
-    for u, v in G.edges():
-        x0, y0 = pos[u]
-        x1, y1 = pos[v]
-        edge_x += [x0, x1, None]
-        edge_y += [y0, y1, None]
-        edge_colors.append(
-            "#669673"
-            if (u, v) in backbone_edges or (v, u) in backbone_edges
-            else "grey"
-        )
-        opacities.append(
-            0.8 if (u, v) in backbone_edges or (v, u) in backbone_edges else 0.2
+        backbone_edges = frozenset()
+
+    # Node positions as rows of one array, and edges as pairs of row indices.
+    nodes_list = list(G.nodes())
+    index = {n: i for i, n in enumerate(nodes_list)}
+    P = np.array([pos[n] for n in nodes_list]).reshape(-1, 2)
+    edge_index, on_backbone, annotations = [], [], []
+    for u, v, attr in G.edges(data=True):
+        i, j = index[u], index[v]
+        edge_index.append((i, j))
+        on_backbone.append((u, v) in backbone_edges)
+        annotations.append(
+            dict(
+                x=(P[i, 0] + P[j, 0]) / 2,
+                y=(P[i, 1] + P[j, 1]) / 2,
+                text=attr.get("Assigned Symbol", ""),
+                showarrow=False,
+                font=dict(size=30, color="grey"),
+            )
         )
+    edges = np.array(edge_index, dtype=int).reshape(-1, 2)
+    on_backbone = np.array(on_backbone, dtype=bool)
 
+    # Split edges by backbone membership in one pass, one trace per EDGE_STYLES entry.
+    xs_bb, ys_bb, xs_other, ys_other = _kernels.build_edge_arrays(
+        P, edges[:, 0], edges[:, 1], on_backbone
+    )
     edge_traces = []
-    for i in range(len(G.edges())):
+    for (edge_x, edge_y), (color, opacity) in zip(
+        ((xs_other, ys_other), (xs_bb, ys_bb)), EDGE_STYLES
+    ):
         edge_traces.append(
-            go.Scatter(
-                x=edge_x[i * 3 : i * 3 + 2],
-                y=edge_y[i * 3 : i * 3 + 2],
-                line=dict(width=1, color=edge_colors[i]),
+            dict(
+                type="scatter",
+                x=edge_x,
+                y=edge_y,
+                line=dict(width=1, color=color),
                 hoverinfo="none",
-                opacity=opacities[i],
+                opacity=opacity,
                 mode="lines",
             )
         )
 
-    node_x, node_y, node_text = zip(
-        *[(pos[n][0], pos[n][1], str(n)) for n in G.nodes()]
+    node_text = np.fromiter(
+        (str(n) for n in nodes_list), dtype=object, count=len(nodes_list)
     )
-    node_trace = go.Scatter(
-        x=node_x,
-        y=node_y,
+    node_trace = dict(
+        type="scatter",
+        x=P[:, 0],
+        y=P[:, 1],
         mode="markers+text",
         marker=dict(size=3, color="#669673"),
         text=node_text,
@@ -177,18 +224,8 @@ def plot_peak_diff_graph(df_assigned: pd.DataFrame) -> Figure:
     )
 
     fig = go.Figure(data=edge_traces + [node_trace])
-    for u, v, attr in G.edges(data=True):
-        x0, y0 = pos[u]
-        x1, y1 = pos[v]
-        label = attr.get("Assigned Symbol", "")
-        fig.add_annotation(
-            x=(x0 + x1) / 2,
-            y=(y0 + y1) / 2,
-            text=label,
-            showarrow=False,
-            font=dict(size=30, color="grey"),
-        )
     fig.update_layout(
+        annotations=annotations,
         showlegend=False,
         xaxis_visible=False,
         yaxis_visible=False,
@@ -197,78 +234,78 @@ def plot_peak_diff_graph(df_assigned: pd.DataFrame) -> Figure:
     return fig
 
 
-def generate_glycan_graph(G: nx.Graph) -> Tuple[List, List]:
+def generate_glycan_graph(G: nx.Graph) -> Tuple[Dict[str, np.ndarray], List]:
 
-    # Example node / edge list:
-    # nodes = [
-    #     {"x": 0, "y": 0, "label": "GlcNAc", "color": "orange"},
-    #     {"x": 1, "y": 0, "label": "Man", "color": "green"},
-    #     {"x": 2, "y": 0, "label": "Man", "color": "green"},
-    # ]
+    # Example node arrays / edge list:
+    # nodes = {
+    #     "x": np.array([0, 1, 2]),
+    #     "y": np.array([0, 0, 0]),
+    #     "label": np.array(["GlcNAc", "Man", "Man"], dtype=object),
+    #     "color": np.array(["orange", "green", "green"], dtype=object),
+    # }
     # edges = [(0, 1), (1, 2)]
 
-    nodes = []
+    xs, ys, labels = [], [], []
     edges = []
-    smallest_peak = min(G.nodes)
-    largest_peak = max(G.nodes)
-    backbone = nx.shortest_path(G, source=largest_peak, target=smallest_peak)
-    branches = {}
+    backbone = _backbone(G)
+    backbone_set = set(backbone)
+    off_backbone = [n for n in G.nodes if n not in backbone_set]
     for i in range(len(backbone) - 1):
         node = backbone[i]
-        nodes.append(
-            {
-                "x": i,
-                "y": 0,
-                "label": G.edges[backbone[i], backbone[i + 1]]["Assigned Symbol"],
-            }
-        )
+        xs.append(i)
+        ys.append(0)
+        labels.append(G.edges[backbone[i], backbone[i + 1]]["Assigned Symbol"])
         deg = G.degree(node)
         if deg > 2:
-            neighbors = list(G.neighbors(node))
-            for n in neighbors:
-                if n not in backbone:
-                    for path in nx.all_simple_paths(G, source=node, target=n):
-                        for j in range(len(path) - 1):
-                            nodes.append(
-                                {
-                                    "x": i,
-                                    "y": j + 1,
-                                    "label": G.edges[path[j], backbone[j + 1]][
-                                        "Assigned Symbol"
-                                    ],
-                                }
-                            )
-
+            # Walk the branches hanging off this backbone node once, breadth first.
+            depth = {node: 0}
+            branch = G.subgraph([node] + off_backbone)
+            for parent, child in nx.bfs_edges(branch, source=node):
+                depth[child] = depth[parent] + 1
+                xs.append(i)
+                ys.append(depth[child])
+                labels.append(G.edges[parent, child]["Assigned Symbol"])
+
+    nodes = {
+        "x": np.array(xs),
+        "y": np.array(ys),
+        "label": np.array(labels, dtype=object),
+        "color": np.full(len(xs), "#669673", dtype=object),
+    }
     return nodes, edges
 
 
-def plot_glycan(nodes: List, edges: List) -> Figure:
+def plot_glycan(nodes: Dict[str, np.ndarray], edges: List) -> Figure:
     fig = go.Figure()
 
-    for i, j in edges:
-        fig.add_shape(
-            type="line",
-            x0=nodes[i]["x"],
-            y0=nodes[i]["y"],
-            x1=nodes[j]["x"],
-            y1=nodes[j]["y"],
+    # All edges as one line trace, added first so it is drawn below the nodes.
+    points = np.column_stack([nodes["x"], nodes["y"]])
+    edge_x, edge_y = _segments(points, np.asarray(edges, dtype=int).reshape(-1, 2))
+    fig.add_trace(
+        dict(
+            type="scatter",
+            x=edge_x,
+            y=edge_y,
+            mode="lines",
             line=dict(color="black", width=2),
-            layer="below",
+            hoverinfo="skip",
         )
+    )
 
     fig.add_trace(
-        go.Scatter(
-            x=[n["x"] for n in nodes],
-            y=[n["y"] for n in nodes],
+        dict(
+            type="scatter",
+            x=nodes["x"],
+            y=nodes["y"],
             mode="markers+text",
             marker=dict(
                 size=40,
-                color=[n["color"] for n in nodes],
+                color=nodes["color"],
                 line=dict(color="black", width=1),
             ),
-            text=[n["label"] for n in nodes],
+            text=nodes["label"],
             textposition="bottom center",
-            hovertext=[n["label"] for n in nodes],
+            hovertext=nodes["label"],
             hoverinfo="text",
         )
     )
@@ -281,4 +318,4 @@ def plot_glycan(nodes: List, edges: List) -> Figure:
         height=400,
     )
 
-    return fig
\ No newline at end of file
+    return fig